@@ -1,4 +1,6 @@
-from flask import Flask, request, jsonify, render_template
+import hmac
+import os
+from flask import Flask, request, jsonify, render_template, abort, send_file
 from transformations.RemoveUnnecessaryElseTransformation import RemoveUnnecessaryElseTransformation
 from transformations.ConvertForLoopsToListComprehensionTransformation import ConvertForLoopsToListComprehensionTransformation
 from transformations.ReorderPlusOperandsTransformation import ReorderPlusOperandsTransformation
@@ -7,9 +9,104 @@ from transformations.AddExpectedLinesTransformation import AddExpectedLinesTrans
 from transformations.MergeComparisonTransformation import MergeComparisonTransformation
 from encoder import Encoder
 from callgpt import call_gpt
+from uploads import MAX_CODE_BYTES, CodeTooLarge, InvalidUpload, read_limited
+from preview import PREVIEW_MAX_CODE_BYTES, PreviewSessions, apply_delta, text_delta
+import profiling
 
 app = Flask(__name__)
 
+# Upper bound on the size of the request body as sent over the wire. JSON
+# bodies are loaded whole by Flask, so this is what bounds their memory.
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('ACW_MAX_CONTENT_LENGTH', MAX_CODE_BYTES))
+
+preview_sessions = PreviewSessions()
+
+WATERMARK = [1, 0]
+N_APPLIED = 2
+WATERMARK_LENGTH = 4
+ALLOWED_ERRORS = 0
+
+# Token required by the /admin routes and by profiled requests; both are
+# disabled when it is unset
+ADMIN_TOKEN = os.getenv('ACW_ADMIN_TOKEN')
+
+
+def read_code():
+    """
+    Returns (code, transformation order) from the request. Accepts a JSON body,
+    a multipart upload in the `code` field, or a raw text body streamed as-is.
+    Multipart and raw bodies may be gzipped; the order then comes from the
+    `transformationOrder` query parameter (repeated or comma separated).
+
+    Multipart and raw bodies are streamed and capped at MAX_CODE_BYTES after
+    decompression. JSON bodies are parsed whole by Flask, so only
+    MAX_CONTENT_LENGTH bounds their memory; the UTF-8 size of `code` is then
+    checked against MAX_CODE_BYTES as well.
+    """
+    if request.is_json:
+        code = request.json['code']
+        if not isinstance(code, str):
+            raise InvalidUpload('`code` must be a string')
+        try:
+            code_bytes = len(code.encode('utf-8'))
+        except UnicodeEncodeError:
+            raise InvalidUpload('`code` is not valid Unicode')
+        if code_bytes > MAX_CODE_BYTES:
+            raise CodeTooLarge()
+        return code, request.json.get('transformationOrder', [])
+
+    transform_order = []
+    for value in request.args.getlist('transformationOrder'):
+        transform_order.extend(name for name in value.split(',') if name)
+
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files['code']
+        gzipped = (upload.mimetype in ('application/gzip', 'application/x-gzip')
+                   or (upload.filename or '').endswith('.gz'))
+        return read_limited(upload.stream, gzipped), transform_order
+
+    gzipped = request.content_encoding == 'gzip'
+    return read_limited(request.stream, gzipped), transform_order
+
+
+def build_transformations(transform_order):
+    """
+    Returns the transformation instances named in transform_order, in order.
+    """
+    transformation_map = {
+        "RemoveUnnecessaryElse": RemoveUnnecessaryElseTransformation,
+        "ConvertForLoopsToListComprehension": ConvertForLoopsToListComprehensionTransformation,
+        "FixingMissingWhiteSpaces": FixingMissingWhiteSpacesTransformation,
+        "ReorderPlusOperands": ReorderPlusOperandsTransformation,
+        "MergeComparison": MergeComparisonTransformation,
+        "AddExpectedLines": AddExpectedLinesTransformation
+    }
+    return [transformation_map[name]() for name in transform_order]
+
+
+def is_admin():
+    token = request.headers.get('X-ACW-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'),
+                                                      ADMIN_TOKEN.encode('utf-8'))
+
+
+def profile_requested():
+    """
+    Profiling is several times slower than a normal run, so it is only honored
+    for requests that also carry the admin token.
+    """
+    return ((request.headers.get('X-ACW-Profile') == '1'
+             or request.args.get('profile') == '1')
+            and is_admin())
+
+
+def require_admin():
+    if not ADMIN_TOKEN:
+        abort(404)
+    if not is_admin():
+        abort(403)
+
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -17,32 +114,115 @@ def home():
 # Modify app.py endpoint
 @app.route('/transform', methods=['POST'])
 def transform():
-    code = request.json['code']
-    transform_order = request.json.get('transformationOrder', [])
+    try:
+        code, transform_order = read_code()
+    except CodeTooLarge:
+        return jsonify({'error': f'Code exceeds the {MAX_CODE_BYTES} byte limit'}), 413
+    except (KeyError, TypeError, InvalidUpload):
+        return jsonify({'error': 'Could not read code from request'}), 400
     
     # Create ordered transformation list
-    transformation_map = {
-        "RemoveUnnecessaryElse": RemoveUnnecessaryElseTransformation(),
-        "ConvertForLoopsToListComprehension": ConvertForLoopsToListComprehensionTransformation(),
-        "FixingMissingWhiteSpaces": FixingMissingWhiteSpacesTransformation(),
-        "ReorderPlusOperands": ReorderPlusOperandsTransformation(),
-        "MergeComparison": MergeComparisonTransformation(),
-        "AddExpectedLines": AddExpectedLinesTransformation()
-    }
-    
-    transformations = [transformation_map[name] for name in transform_order]
+    try:
+        transformations = build_transformations(transform_order)
+    except (KeyError, TypeError) as e:
+        return jsonify({'error': f'Unknown transformation {e}'}), 400
     
-    watermark = [1, 0]
-    n = 2
-    l = 4
-    e = 0
-    
-    transformed_code = Encoder(code, transformations, watermark, n, l, e)
+    response = {'applied_transformations': transform_order[:N_APPLIED]}
+    if profile_requested():
+        transformed_code, record = profiling.run_profiled(
+            code, Encoder, code, transformations, WATERMARK, N_APPLIED,
+            WATERMARK_LENGTH, ALLOWED_ERRORS)
+        # None when the profiler was rate-limited
+        response['profile_id'] = record['id'] if record else None
+    else:
+        transformed_code = Encoder(code, transformations, WATERMARK, N_APPLIED,
+                                   WATERMARK_LENGTH, ALLOWED_ERRORS)
+    response['transformed_code'] = transformed_code
+    return jsonify(response)
+
+@app.route('/transform/delta', methods=['POST'])
+def transform_delta():
+    """
+    Live-preview endpoint. The first request (no sessionId) carries the full
+    code and opens a session; later requests carry only a text delta against
+    the code the server last saw. The response is a delta against the
+    previously returned transformed code, plus per-transformation timings.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    session_id = data.get('sessionId')
+    transform_order = data.get('transformationOrder')
+    if session_id is not None and not isinstance(session_id, str):
+        return jsonify({'error': '`sessionId` must be a string'}), 400
+    if transform_order is not None and not (
+            isinstance(transform_order, list)
+            and all(isinstance(name, str) for name in transform_order)):
+        return jsonify({'error': '`transformationOrder` must be a list of names'}), 400
+
+    session = preview_sessions.get(session_id) if session_id else None
+    if session is None:
+        if not isinstance(data.get('code'), str):
+            # Unknown or expired session: ask the client to resend everything
+            return jsonify({'error': 'Unknown session', 'resync': True}), 409
+        session_id = PreviewSessions.new_id()
+        session = {'code': '', 'transformed_code': '', 'order': []}
+        code = data['code']
+    else:
+        try:
+            code = apply_delta(session['code'], data.get('delta'))
+        except ValueError:
+            return jsonify({'error': 'Invalid delta', 'resync': True}), 409
+
+    try:
+        code_bytes = len(code.encode('utf-8'))
+    except UnicodeEncodeError:
+        # An unpaired surrogate; start over from the editor's full text
+        return jsonify({'error': 'Code is not valid Unicode', 'resync': True}), 409
+    if code_bytes > PREVIEW_MAX_CODE_BYTES:
+        return jsonify({'error': f'Code exceeds the {PREVIEW_MAX_CODE_BYTES} byte live-preview limit'}), 413
+
+    if transform_order is None:
+        transform_order = session['order']
+    timings = {}
+    if code == session['code'] and transform_order == session['order']:
+        transformed_code = session['transformed_code']
+    else:
+        try:
+            transformations = build_transformations(transform_order)
+        except KeyError as e:
+            return jsonify({'error': f'Unknown transformation {e}'}), 400
+        transformed_code = Encoder(code, transformations, WATERMARK, N_APPLIED,
+                                   WATERMARK_LENGTH, ALLOWED_ERRORS, timings)
+
+    delta = text_delta(session['transformed_code'], transformed_code)
+    preview_sessions.put(session_id, code, transformed_code, transform_order)
     return jsonify({
-        'transformed_code': transformed_code,
-        'applied_transformations': transform_order[:n]
+        'sessionId': session_id,
+        'delta': delta,
+        'timings': timings,
+        'applied_transformations': transform_order[:N_APPLIED]
     })
 
+@app.route('/admin/profiles')
+def list_profiles():
+    require_admin()
+    return jsonify({'profiles': [
+        {key: value for key, value in record.items() if not key.endswith('_path')}
+        for record in profiling.slowest_profiles()
+    ]})
+
+@app.route('/admin/profiles/<profile_id>')
+def get_profile(profile_id):
+    require_admin()
+    record = profiling.get_profile(profile_id)
+    # Another worker may have pruned the files already
+    if record is None or not os.path.exists(record['speedscope_path']):
+        abort(404)
+    if request.args.get('format') == 'collapsed':
+        return send_file(os.path.abspath(record['collapsed_path']), mimetype='text/plain')
+    return send_file(os.path.abspath(record['speedscope_path']), mimetype='application/json')
+
 @app.route('/summarize', methods=['POST'])
 def summarize():
     data = request.json
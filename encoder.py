@@ -1,4 +1,6 @@
 import hashlib
+import time
+from profiling import run_profiled
 
 def sort(applicable_transformations):
     def sha256_key(t):
@@ -22,7 +24,7 @@ def hamming_encode(data):
     return [p1, p2, d1, d2]
 
 
-def Encoder(C, T, w, n,l,e):
+def Encoder(C, T, w, n,l,e, timings=None, profile=False, profile_info=None):
     """
     Encodes a given code snippet with a specifc watermark 
         Parameters:
@@ -32,15 +34,32 @@ def Encoder(C, T, w, n,l,e):
         n (int): The first n transformation to apply to the code snippet.
         l (int): The length of the encoded watermark.
         e (int): The number of allowed errors in the watermark.
+        timings (dict, optional): If given, filled with the seconds spent in each
+            transformation (applicability check plus transform), keyed by name.
+        profile (bool, optional): If True, run under the profiler (subject to its
+            rate limit) and store the captured profile, see profiling.py.
+        profile_info (dict, optional): If given with profile=True, filled with
+            'captured' (False when rate-limited) and the profile record's fields.
     
     """
+    if profile:
+        C_w, record = run_profiled(C, Encoder, C, T, w, n, l, e, timings)
+        if profile_info is not None:
+            profile_info['captured'] = record is not None
+            profile_info.update(record or {})
+        return C_w
+
     T_a = [] #Initialize an empty list to store applicable transformations
     C_w = C #Initialize the transformed code to be the code snippet
 
     #Iterate through the list of transformations
     for t in T:
+        if timings is not None:
+            start = time.perf_counter()
         if t.is_applicable(C):
             T_a.append(t) #Append the transformation to the list of applicable transformations
+        if timings is not None:
+            timings[t.transformation_name] = time.perf_counter() - start
     
     #Sort the list of applicable transformations
     T_a = sort(T_a)
@@ -54,7 +73,11 @@ def Encoder(C, T, w, n,l,e):
     
     #Apply the first n transformations to the code snippet
     for t in T_a[:n]:
+        if timings is not None:
+            start = time.perf_counter()
         C_w = t.transform(C_w)
+        if timings is not None:
+            timings[t.transformation_name] += time.perf_counter() - start
     
     #Encode the watermark
     W_en = hamming_encode(w)
@@ -64,7 +87,11 @@ def Encoder(C, T, w, n,l,e):
     for i, t in enumerate(T_a[n:n+l], 0):
         if W_en[i] == 1:
             print(f"Applying transformation {i+n+1} to the code snippet based on watermark.")
+            if timings is not None:
+                start = time.perf_counter()
             C_w = t.transform(C_w)
+            if timings is not None:
+                timings[t.transformation_name] += time.perf_counter() - start
 
     return C_w
 
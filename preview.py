@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Total memory (bytes, as reported by sys.getsizeof) of all live-preview sessions
+PREVIEW_MAX_BYTES = int(os.getenv('ACW_PREVIEW_MAX_BYTES', 64 * 1024 * 1024))
+# Largest code (UTF-8 bytes) a live-preview session may hold
+PREVIEW_MAX_CODE_BYTES = int(os.getenv('ACW_PREVIEW_MAX_CODE_BYTES', 1024 * 1024))
+# Seconds after which an idle session is dropped
+PREVIEW_SESSION_TTL = float(os.getenv('ACW_PREVIEW_SESSION_TTL', 600))
+
+
+def _utf16_len(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def text_delta(old, new):
+    """
+    Returns the smallest single edit {start, end, text} such that applying it
+    to `old` with apply_delta gives `new`. Offsets count UTF-16 code units,
+    the way JavaScript indexes strings in the browser.
+    """
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    start_units = _utf16_len(old[:start])
+    return {
+        'start': start_units,
+        'end': start_units + _utf16_len(old[start:end_old]),
+        'text': new[start:end_new],
+    }
+
+
+def apply_delta(text, delta):
+    """
+    Applies a delta whose offsets count UTF-16 code units. Raises ValueError
+    if it is malformed, does not fit `text`, or leaves an unpaired surrogate.
+    """
+    if not isinstance(delta, dict):
+        raise ValueError('Delta must be an object')
+    start, end, new_text = delta.get('start'), delta.get('end'), delta.get('text')
+    if not (isinstance(start, int) and isinstance(end, int) and isinstance(new_text, str)):
+        raise ValueError('Delta needs integer start/end and string text')
+    units = text.encode('utf-16-le')
+    if not 0 <= start <= end <= len(units) // 2:
+        raise ValueError('Delta out of range')
+    # A delta may carry half of a surrogate pair whose other half is in
+    # `text`; the strict decode accepts it only if the halves pair up
+    replacement = new_text.encode('utf-16-le', 'surrogatepass')
+    try:
+        return (units[:2 * start] + replacement + units[2 * end:]).decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise ValueError('Delta leaves an unpaired surrogate')
+
+
+class PreviewSessions:
+    """
+    Thread-safe store of live-preview sessions, bounded by total size and
+    idle time. Sessions are evicted least recently used first.
+    """
+    def __init__(self, max_bytes=PREVIEW_MAX_BYTES, ttl=PREVIEW_SESSION_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self._sessions = OrderedDict()  # session id -> session dict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self.total_bytes -= session['size']
+
+    def _expire(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session['touched'] < self.ttl:
+                break
+            self._drop(session_id)
+
+    def get(self, session_id):
+        """
+        Returns a copy of the session's {'code', 'transformed_code', 'order'},
+        or None if it is unknown or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session['touched'] = now
+            self._sessions.move_to_end(session_id)
+            return {key: session[key] for key in ('code', 'transformed_code', 'order')}
+
+    def put(self, session_id, code, transformed_code, order):
+        """
+        Stores a session (a new id from new_id() or an existing one), then
+        evicts the least recently used sessions until the store fits in
+        max_bytes.
+        """
+        now = time.monotonic()
+        size = sys.getsizeof(code) + sys.getsizeof(transformed_code)
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+            self._sessions[session_id] = {
+                'code': code,
+                'transformed_code': transformed_code,
+                'order': order,
+                'size': size,
+                'touched': now,
+            }
+            self.total_bytes += size
+            self._expire(now)
+            while self.total_bytes > self.max_bytes:
+                self._drop(next(iter(self._sessions)))
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+# Directory where captured profiles are written
+PROFILE_DIR = os.getenv('ACW_PROFILE_DIR', 'profiles')
+# Minimum number of seconds between two profiled runs
+PROFILE_MIN_INTERVAL = float(os.getenv('ACW_PROFILE_MIN_INTERVAL', 10))
+# Number of profiles kept, in memory and on disk
+MAX_RECENT_PROFILES = int(os.getenv('ACW_MAX_RECENT_PROFILES', 50))
+
+# Records of the kept profiles, oldest first; rebuilt from PROFILE_DIR at import
+recent_profiles = deque()
+
+# Incomplete captures younger than this may still be written by another worker
+ORPHAN_GRACE_SECONDS = 60
+
+# Files written per capture: <id>.meta.json holds the record itself
+_SUFFIXES = ('.meta.json', '.speedscope.json', '.collapsed.txt')
+_PROFILE_FILE = re.compile(r'^([0-9a-f]{12})(\.meta\.json|\.speedscope\.json|\.collapsed\.txt)$')
+
+_lock = threading.Lock()
+_last_profile_start = None
+_profile_in_progress = False
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class StackProfiler:
+    """
+    Deterministic profiler that records the self time of every full call stack,
+    which is what collapsed-stack and speedscope files need.
+    """
+    def __init__(self):
+        self.stacks = Counter()  # stack tuple -> self time in nanoseconds
+        self._stack = []
+        self._last = None
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if self._stack:
+            self.stacks[tuple(self._stack)] += now - self._last
+
+        if event == 'call':
+            self._stack.append(_frame_name(frame.f_code))
+        elif event == 'c_call':
+            self._stack.append(f"{getattr(arg, '__qualname__', repr(arg))} (builtin)")
+        elif self._stack:
+            # return, c_return or c_exception; frames entered before start()
+            # return with an empty stack and are ignored
+            self._stack.pop()
+
+        self._last = time.perf_counter_ns()
+
+    def start(self):
+        self._last = time.perf_counter_ns()
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+        # The call to stop() itself was recorded before the profiler detached
+        own_frame = _frame_name(StackProfiler.stop.__code__)
+        for stack in [stack for stack in self.stacks if own_frame in stack]:
+            del self.stacks[stack]
+
+    def collapsed(self):
+        """
+        Returns the profile in collapsed-stack format ("a;b;c <microseconds>").
+        """
+        lines = []
+        for stack, ns in self.stacks.items():
+            if ns >= 1000:
+                lines.append(f"{';'.join(stack)} {ns // 1000}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name):
+        """
+        Returns the profile as a speedscope "sampled" profile.
+        """
+        frames = []
+        frame_index = {}
+        samples = []
+        weights = []
+        for stack, ns in self.stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({'name': frame})
+                sample.append(frame_index[frame])
+            samples.append(sample)
+            weights.append(ns)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'nanoseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+            'name': name,
+            'exporter': 'acw',
+        }
+
+
+def _acquire_slot():
+    """
+    Rate limiter: allows at most one profiled run to start per
+    PROFILE_MIN_INTERVAL seconds, and none while another is still running.
+    Must be paired with _release_slot() when it returns True.
+    """
+    global _last_profile_start, _profile_in_progress
+    now = time.monotonic()
+    with _lock:
+        if _profile_in_progress:
+            return False
+        if _last_profile_start is not None and now - _last_profile_start < PROFILE_MIN_INTERVAL:
+            return False
+        _last_profile_start = now
+        _profile_in_progress = True
+        return True
+
+
+def _release_slot():
+    global _profile_in_progress
+    with _lock:
+        _profile_in_progress = False
+
+
+def _path(profile_id, suffix):
+    return os.path.join(PROFILE_DIR, profile_id + suffix)
+
+
+def _remove_files(profile_id):
+    for suffix in _SUFFIXES:
+        try:
+            os.remove(_path(profile_id, suffix))
+        except FileNotFoundError:
+            pass
+
+
+def _prune():
+    """
+    Drops the oldest records beyond MAX_RECENT_PROFILES, with their files.
+    """
+    with _lock:
+        evicted = []
+        while len(recent_profiles) > MAX_RECENT_PROFILES:
+            evicted.append(recent_profiles.popleft())
+    for record in evicted:
+        _remove_files(record['id'])
+
+
+def load_index():
+    """
+    Rebuilds recent_profiles from the captures in PROFILE_DIR, so profiles
+    survive a restart. Files without a readable .meta.json (e.g. from an
+    interrupted capture) are deleted once older than ORPHAN_GRACE_SECONDS,
+    then the index is pruned to MAX_RECENT_PROFILES.
+    """
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        names = []
+    files_by_id = {}
+    for name in names:
+        match = _PROFILE_FILE.match(name)
+        if match:
+            files_by_id.setdefault(match.group(1), set()).add(match.group(2))
+
+    records = []
+    now = time.time()
+    for profile_id, suffixes in files_by_id.items():
+        try:
+            if set(_SUFFIXES) != suffixes:
+                raise ValueError('Incomplete capture')
+            with open(_path(profile_id, '.meta.json')) as f:
+                record = json.load(f)
+            if not (isinstance(record, dict)
+                    and isinstance(record.get('duration'), (int, float))
+                    and isinstance(record.get('timestamp'), (int, float))):
+                raise ValueError('Invalid metadata')
+        except (OSError, ValueError):
+            try:
+                age = now - max(os.path.getmtime(_path(profile_id, suffix)) for suffix in suffixes)
+            except OSError:
+                age = ORPHAN_GRACE_SECONDS
+            if age >= ORPHAN_GRACE_SECONDS:
+                _remove_files(profile_id)
+            continue
+        record.update(id=profile_id,
+                      speedscope_path=_path(profile_id, '.speedscope.json'),
+                      collapsed_path=_path(profile_id, '.collapsed.txt'))
+        records.append(record)
+
+    records.sort(key=lambda record: record['timestamp'])
+    with _lock:
+        recent_profiles.clear()
+        recent_profiles.extend(records)
+    _prune()
+
+
+def run_profiled(code, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) under the stack profiler and stores the result
+    as speedscope JSON and collapsed stacks next to the hash of `code`.
+
+    Returns (result, record); record is None if the run was rate-limited, in
+    which case func is called without profiling.
+    """
+    if not _acquire_slot():
+        return func(*args, **kwargs), None
+
+    profiler = StackProfiler()
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.stop()
+        _release_slot()
+    duration = time.perf_counter() - start
+
+    encoded = code.encode('utf-8')
+    input_hash = hashlib.sha256(encoded).hexdigest()
+    input_bytes = len(encoded)
+    del encoded
+    profile_id = uuid.uuid4().hex[:12]
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    record = {
+        'id': profile_id,
+        'input_sha256': input_hash,
+        'input_bytes': input_bytes,
+        'duration': duration,
+        'timestamp': time.time(),
+        'speedscope_path': _path(profile_id, '.speedscope.json'),
+        'collapsed_path': _path(profile_id, '.collapsed.txt'),
+    }
+    with open(record['speedscope_path'], 'w') as f:
+        json.dump(profiler.speedscope(f"{func.__name__} {input_hash[:12]}"), f)
+    with open(record['collapsed_path'], 'w') as f:
+        f.write(profiler.collapsed())
+    # Written last: a capture only counts once its metadata exists
+    with open(_path(profile_id, '.meta.json'), 'w') as f:
+        json.dump({key: value for key, value in record.items() if not key.endswith('_path')}, f)
+
+    with _lock:
+        recent_profiles.append(record)
+    _prune()
+    return result, record
+
+
+def get_profile(profile_id):
+    with _lock:
+        for record in recent_profiles:
+            if record['id'] == profile_id:
+                return record
+    return None
+
+
+def slowest_profiles():
+    """
+    Returns the recent profile records, slowest first.
+    """
+    with _lock:
+        records = list(recent_profiles)
+    return sorted(records, key=lambda record: record['duration'], reverse=True)
+
+
+load_index()
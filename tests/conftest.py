@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client():
+    for module in ('flask', 'dotenv', 'openai', 'astunparse'):
+        pytest.importorskip(module)
+    # callgpt builds its OpenAI client at import time
+    os.environ.setdefault('OPENAI_API_KEY', 'test')
+    from app import app
+    app.config['TESTING'] = True
+    return app.test_client()
@@ -0,0 +1,49 @@
+import libcst as cst
+import pytest
+
+from transformations.chunks import top_level_chunks
+from transformations.RemoveUnnecessaryElseTransformation import RemoveUnnecessaryElseCSTTransformer
+from transformations.ReorderPlusOperandsTransformation import ReorderPlusOperandsTransformer
+
+SOURCE = (
+    "# header\n"
+    "@decorator\n"
+    "@decorator_with_args(\n"
+    "    1)\n"
+    "def f(x):\n"
+    "    if x:\n"
+    "        return a + b\n"
+    "    else:\n"
+    "        return 1\n"
+    "s = \"\"\"a\n"
+    "b\"\"\"; t = 1 + 2\n"
+    "if y:\n"
+    "    pass\n"
+    "else:\n"
+    "    z = 3\n"
+)
+
+
+@pytest.mark.parametrize('source', [SOURCE, SOURCE.replace("\n", "\r\n"), "x = (\n"])
+@pytest.mark.parametrize('chunk_size', [1, 40, 10 ** 6])
+def test_chunks_concatenate_to_source(source, chunk_size):
+    assert "".join(top_level_chunks(source, chunk_size)) == source
+
+
+def test_chunks_keep_statements_whole():
+    chunks = list(top_level_chunks(SOURCE, 1))
+    assert chunks[0] == "# header\n"
+    # Decorators stay with their function
+    assert chunks[1].startswith("@decorator\n") and chunks[1].endswith("return 1\n")
+    # The string and the statement after it on the same line stay together
+    assert chunks[2] == "s = \"\"\"a\nb\"\"\"; t = 1 + 2\n"
+    # `else` stays with its `if`
+    assert chunks[3].startswith("if y:") and chunks[3].endswith("z = 3\n")
+
+
+@pytest.mark.parametrize('transformer', [ReorderPlusOperandsTransformer, RemoveUnnecessaryElseCSTTransformer])
+def test_chunked_transform_matches_whole_module(transformer):
+    whole = cst.parse_module(SOURCE).visit(transformer()).code
+    chunked = "".join(cst.parse_module(chunk).visit(transformer()).code
+                      for chunk in top_level_chunks(SOURCE, 1))
+    assert chunked == whole
@@ -0,0 +1,148 @@
+import ast
+import gzip
+import io
+import tracemalloc
+
+import pytest
+
+import uploads
+from encoder import Encoder
+from transformations.MergeComparisonTransformation import MergeComparisonTransformation
+from transformations.RemoveUnnecessaryElseTransformation import RemoveUnnecessaryElseTransformation
+from transformations.ReorderPlusOperandsTransformation import ReorderPlusOperandsTransformation
+
+MB = 1024 * 1024
+
+FUNCTION = (
+    "def f{i}(x):\n"
+    "    if x == 1 or x == 2:\n"
+    "        return x + {i}\n"
+    "    else:\n"
+    "        return 0\n"
+)
+
+
+def generated_module(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        part = FUNCTION.format(i=i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def peak_during(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def test_read_limited_peak_is_about_twice_the_input():
+    data = ("x = 1\n" * (4 * MB // 6)).encode('utf-8')
+    code, peak = peak_during(uploads.read_limited, io.BytesIO(data), limit=8 * MB)
+    assert len(code) == len(data)
+    # One bytearray buffer plus the decoded str
+    assert peak < 2.5 * len(data)
+
+
+def test_read_limited_gzip_peak_is_about_twice_the_input():
+    data = ("x = 1\n" * (4 * MB // 6)).encode('utf-8')
+    body = io.BytesIO(gzip.compress(data))
+    code, peak = peak_during(uploads.read_limited, body, gzipped=True, limit=8 * MB)
+    assert len(code) == len(data)
+    assert peak < 2.5 * len(data)
+
+
+@pytest.mark.parametrize('transformation', [
+    RemoveUnnecessaryElseTransformation(),
+    ReorderPlusOperandsTransformation(),
+])
+def test_libcst_transformation_peak_stays_near_one_ast(transformation):
+    code = generated_module(128 * 1024)
+
+    _, one_tree = peak_during(ast.parse, code)
+    transformed, peak = peak_during(transformation.transform, code)
+
+    assert transformed != code
+    # A whole-module CST costs about twice an ast tree; transforming one
+    # chunk of statements at a time keeps the peak at the ast used to find
+    # the chunk boundaries
+    assert peak < 1.3 * one_tree
+
+
+def test_encoder_peak_stays_near_one_ast():
+    code = generated_module(128 * 1024)
+    transformations = [
+        MergeComparisonTransformation(),
+        RemoveUnnecessaryElseTransformation(),
+        ReorderPlusOperandsTransformation(),
+    ]
+
+    _, one_tree = peak_during(ast.parse, code)
+    transformed, peak = peak_during(Encoder, code, transformations, [1, 0], 2, 4, 0)
+
+    assert transformed != code
+    assert peak < 1.3 * one_tree
+
+
+def test_read_limited_rejects_oversized_body():
+    with pytest.raises(uploads.CodeTooLarge):
+        uploads.read_limited(io.BytesIO(b"x" * (MB + 1)), limit=MB)
+
+
+def test_read_limited_stops_inflating_gzip_bomb():
+    bomb = gzip.compress(b"\0" * (64 * MB))
+
+    def read_bomb():
+        with pytest.raises(uploads.CodeTooLarge):
+            uploads.read_limited(io.BytesIO(bomb), gzipped=True, limit=MB)
+
+    _, peak = peak_during(read_bomb)
+    # Inflation stops just past the 1 MiB limit instead of reaching 64 MiB
+    assert peak < 4 * MB
+
+
+def test_read_limited_rejects_truncated_gzip():
+    body = gzip.compress(b"x = 1\n" * 100)
+    with pytest.raises(uploads.InvalidUpload):
+        uploads.read_limited(io.BytesIO(body[:len(body) // 2]), gzipped=True)
+
+
+def test_read_limited_reads_every_gzip_member():
+    body = gzip.compress(b"a" * 500) + gzip.compress(b"b" * 400)
+    assert uploads.read_limited(io.BytesIO(body), gzipped=True) == "a" * 500 + "b" * 400
+
+
+def test_transform_rejects_oversized_raw_body(client, monkeypatch):
+    monkeypatch.setattr(uploads, 'MAX_CODE_BYTES', 1024)
+    response = client.post('/transform', data=b"x = 1\n" * 1000,
+                           content_type='text/plain')
+    assert response.status_code == 413
+
+
+def test_transform_rejects_gzip_bomb(client, monkeypatch):
+    monkeypatch.setattr(uploads, 'MAX_CODE_BYTES', 1024)
+    response = client.post('/transform', data=gzip.compress(b"\0" * MB),
+                           content_type='text/plain',
+                           headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 413
+
+
+def test_transform_rejects_unknown_transformation(client):
+    response = client.post('/transform', json={'code': "x = 1\n", 'transformationOrder': ["Nope"]})
+    assert response.status_code == 400
+
+
+def test_transform_rejects_lone_surrogate(client):
+    response = client.post('/transform', data='{"code": "\\ud800"}',
+                           content_type='application/json')
+    assert response.status_code == 400
@@ -0,0 +1,171 @@
+import random
+import sys
+import threading
+
+import pytest
+
+from preview import PreviewSessions, apply_delta, text_delta
+
+
+def test_text_delta_round_trips():
+    rng = random.Random(0)
+    alphabet = ['a', 'b', '\n', 'é', '😀', '😁']
+    for _ in range(2000):
+        old = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        new = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        assert apply_delta(old, text_delta(old, new)) == new
+
+
+def test_delta_offsets_count_utf16_units():
+    # As the browser computes them: the emoji takes two code units
+    code = "# 😀\nx = 1\n"
+    assert apply_delta(code, {'start': 9, 'end': 10, 'text': '2'}) == "# 😀\nx = 2\n"
+    assert text_delta(code, "# 😀\nx = 2\n") == {'start': 9, 'end': 10, 'text': '2'}
+
+
+def test_apply_delta_joins_split_surrogate_pair():
+    assert apply_delta("# 😀\n", {'start': 3, 'end': 4, 'text': '\ude01'}) == "# 😁\n"
+    with pytest.raises(ValueError):
+        apply_delta("# 😀\n", {'start': 3, 'end': 4, 'text': 'a'})
+
+
+def test_text_delta_is_minimal():
+    assert text_delta("x = 1\ny = 2\n", "x = 1\ny = 3\n") == {'start': 10, 'end': 11, 'text': '3'}
+    assert text_delta("same", "same") == {'start': 4, 'end': 4, 'text': ''}
+
+
+@pytest.mark.parametrize('delta', [
+    None,
+    [],
+    {'start': 0, 'end': 1},
+    {'start': '0', 'end': 1, 'text': ''},
+    {'start': 2, 'end': 1, 'text': ''},
+    {'start': 0, 'end': 10, 'text': ''},
+    {'start': -1, 'end': 0, 'text': ''},
+])
+def test_apply_delta_rejects_bad_deltas(delta):
+    with pytest.raises(ValueError):
+        apply_delta("abc", delta)
+
+
+def test_sessions_round_trip():
+    sessions = PreviewSessions()
+    session_id = sessions.new_id()
+    sessions.put(session_id, "a", "b", ["MergeComparison"])
+    assert sessions.get(session_id) == {
+        'code': "a", 'transformed_code': "b", 'order': ["MergeComparison"]}
+    assert sessions.get("unknown") is None
+
+
+def test_sessions_are_bounded_by_bytes():
+    code = "x" * 1000
+    one_session = 2 * sys.getsizeof(code)
+    sessions = PreviewSessions(max_bytes=3 * one_session)
+    ids = [sessions.new_id() for _ in range(5)]
+    for session_id in ids:
+        sessions.put(session_id, code, code, [])
+    assert len(sessions) == 3
+    assert sessions.total_bytes <= 3 * one_session
+    # Least recently used sessions go first
+    assert sessions.get(ids[0]) is None
+    assert sessions.get(ids[-1]) is not None
+
+
+def test_sessions_expire():
+    sessions = PreviewSessions(ttl=0)
+    session_id = sessions.new_id()
+    sessions.put(session_id, "a", "b", [])
+    assert sessions.get(session_id) is None
+    assert sessions.total_bytes == 0
+
+
+def test_sessions_survive_concurrent_eviction():
+    sessions = PreviewSessions(max_bytes=4 * 2 * sys.getsizeof("x" * 100))
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(500):
+                session_id = sessions.new_id()
+                sessions.put(session_id, "x" * 100, "x" * 100, [])
+                sessions.get(session_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(sessions) <= 4
+
+
+def test_delta_endpoint_round_trip(client):
+    response = client.post('/transform/delta', json={
+        'code': "if x == 1 or x == 2:\n    pass\n",
+        'transformationOrder': ["MergeComparison"],
+    })
+    assert response.status_code == 200
+    first = response.get_json()
+    output = apply_delta("", first['delta'])
+
+    response = client.post('/transform/delta', json={
+        'sessionId': first['sessionId'],
+        'delta': text_delta("if x == 1 or x == 2:\n    pass\n", "if y == 1 or y == 2:\n    pass\n"),
+    })
+    assert response.status_code == 200
+    output = apply_delta(output, response.get_json()['delta'])
+    assert "y in (1, 2)" in output
+
+
+def test_delta_endpoint_asks_for_resync(client):
+    response = client.post('/transform/delta', json={
+        'sessionId': 'expired', 'delta': {'start': 0, 'end': 0, 'text': 'x'}})
+    assert response.status_code == 409
+    assert response.get_json()['resync'] is True
+
+    response = client.post('/transform/delta', json={'code': "x = 1\n", 'transformationOrder': []})
+    session_id = response.get_json()['sessionId']
+    response = client.post('/transform/delta', json={
+        'sessionId': session_id, 'delta': {'start': 0, 'end': 99, 'text': ''}})
+    assert response.status_code == 409
+    assert response.get_json()['resync'] is True
+
+
+def test_delta_endpoint_with_non_bmp_characters(client):
+    response = client.post('/transform/delta', json={
+        'code': "# 😀\nx = 1 + 2\n", 'transformationOrder': ["ReorderPlusOperands"]})
+    first = response.get_json()
+    output = apply_delta("", first['delta'])
+
+    response = client.post('/transform/delta', json={
+        'sessionId': first['sessionId'], 'delta': {'start': 13, 'end': 14, 'text': '3'}})
+    assert response.status_code == 200
+    output = apply_delta(output, response.get_json()['delta'])
+    assert "# 😀" in output and "3" in output and "2" not in output
+
+
+def test_delta_endpoint_resyncs_on_unpaired_surrogate(client):
+    response = client.post('/transform/delta', data='{"code": "\\ud800", "transformationOrder": []}',
+                           content_type='application/json')
+    assert response.status_code == 409
+    assert response.get_json()['resync'] is True
+
+    response = client.post('/transform/delta', json={'code': "# 😀\n", 'transformationOrder': []})
+    response = client.post('/transform/delta', json={
+        'sessionId': response.get_json()['sessionId'],
+        'delta': {'start': 3, 'end': 4, 'text': 'a'}})
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2],
+    "code",
+    {'sessionId': ['not', 'hashable'], 'code': "x = 1\n"},
+    {'code': "x = 1\n", 'transformationOrder': "MergeComparison"},
+    {'code': "x = 1\n", 'transformationOrder': ["NoSuchTransformation"]},
+])
+def test_delta_endpoint_rejects_bad_bodies(client, body):
+    response = client.post('/transform/delta', json=body)
+    assert response.status_code == 400
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+
+import pytest
+
+import profiling
+from encoder import Encoder
+from profiling import StackProfiler
+from transformations.MergeComparisonTransformation import MergeComparisonTransformation
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, 'PROFILE_MIN_INTERVAL', 0)
+    monkeypatch.setattr(profiling, '_last_profile_start', None)
+    monkeypatch.setattr(profiling, '_profile_in_progress', False)
+    monkeypatch.setattr(profiling, 'recent_profiles', profiling.deque())
+    return tmp_path
+
+
+def leaf():
+    return sum(str(i).count('1') for i in range(20000))
+
+
+def outer():
+    return leaf()
+
+
+def profile(func):
+    profiler = StackProfiler()
+    profiler.start()
+    func()
+    profiler.stop()
+    return profiler
+
+
+def test_collapsed_contains_full_stacks():
+    lines = profile(outer).collapsed().splitlines()
+    stacks = [line.rsplit(' ', 1)[0].split(';') for line in lines]
+    assert any(stack[:2] == [profiling._frame_name(outer.__code__),
+                             profiling._frame_name(leaf.__code__)] for stack in stacks)
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+
+def test_profiler_leaves_out_its_own_stop_frame():
+    profiler = profile(outer)
+    own_frame = profiling._frame_name(StackProfiler.stop.__code__)
+    assert not any(own_frame in stack for stack in profiler.stacks)
+    assert own_frame not in profiler.collapsed()
+
+
+def test_speedscope_matches_stacks():
+    profiler = profile(outer)
+    document = profiler.speedscope("outer")
+    frames = document['shared']['frames']
+    profile_data = document['profiles'][0]
+    assert profile_data['type'] == 'sampled'
+    assert len(profile_data['samples']) == len(profile_data['weights']) == len(profiler.stacks)
+    assert profile_data['endValue'] == sum(profile_data['weights'])
+    for sample, weight in zip(profile_data['samples'], profile_data['weights']):
+        stack = tuple(frames[index]['name'] for index in sample)
+        assert profiler.stacks[stack] == weight
+
+
+def test_run_profiled_writes_files(profile_dir):
+    result, record = profiling.run_profiled("x = 1\n", outer)
+    assert result == outer()
+    assert record['input_bytes'] == 6
+    with open(record['speedscope_path']) as f:
+        assert json.load(f)['exporter'] == 'acw'
+    assert os.path.exists(record['collapsed_path'])
+    assert profiling.get_profile(record['id']) is record
+
+
+def test_rate_limiter_skips_runs_inside_interval(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_MIN_INTERVAL', 3600)
+    _, first = profiling.run_profiled("a", leaf)
+    result, second = profiling.run_profiled("b", leaf)
+    assert first is not None
+    assert second is None
+    assert result == leaf()
+
+
+def test_rate_limiter_skips_overlapping_runs():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=profiling.run_profiled, args=("a", slow))
+    thread.start()
+    started.wait(5)
+    try:
+        _, record = profiling.run_profiled("b", leaf)
+        assert record is None
+    finally:
+        release.set()
+        thread.join()
+    _, record = profiling.run_profiled("c", leaf)
+    assert record is not None
+
+
+def test_evicted_profiles_are_deleted(monkeypatch, profile_dir):
+    monkeypatch.setattr(profiling, 'MAX_RECENT_PROFILES', 2)
+    records = [profiling.run_profiled(str(i), leaf)[1] for i in range(4)]
+    assert {record['id'] for record in profiling.slowest_profiles()} == \
+        {record['id'] for record in records[2:]}
+    assert len(os.listdir(profile_dir)) == 6
+    for record in records[:2]:
+        assert not os.path.exists(record['speedscope_path'])
+        assert not os.path.exists(record['collapsed_path'])
+
+
+def test_index_survives_restart(profile_dir):
+    records = [profiling.run_profiled(str(i), leaf)[1] for i in range(3)]
+    profiling.recent_profiles.clear()
+
+    profiling.load_index()
+
+    assert [record['id'] for record in profiling.recent_profiles] == \
+        [record['id'] for record in records]
+    restored = profiling.get_profile(records[0]['id'])
+    assert restored['input_sha256'] == records[0]['input_sha256']
+    assert restored['speedscope_path'] == records[0]['speedscope_path']
+
+
+def test_load_index_prunes_old_captures(monkeypatch, profile_dir):
+    records = [profiling.run_profiled(str(i), leaf)[1] for i in range(4)]
+    monkeypatch.setattr(profiling, 'MAX_RECENT_PROFILES', 2)
+
+    profiling.load_index()
+
+    assert [record['id'] for record in profiling.recent_profiles] == \
+        [record['id'] for record in records[2:]]
+    assert len(os.listdir(profile_dir)) == 6
+
+
+def test_load_index_deletes_stale_orphans(profile_dir):
+    stale = profile_dir / "0123456789ab.speedscope.json"
+    stale.write_text("{}")
+    os.utime(stale, (0, 0))
+    fresh = profile_dir / "ba9876543210.collapsed.txt"
+    fresh.write_text("")
+    unrelated = profile_dir / "notes.txt"
+    unrelated.write_text("")
+
+    profiling.load_index()
+
+    assert not stale.exists()
+    # May still be written by another worker
+    assert fresh.exists()
+    assert unrelated.exists()
+    assert len(profiling.recent_profiles) == 0
+
+
+def test_encoder_does_not_time_without_timings(monkeypatch):
+    import encoder
+
+    def fail():
+        raise AssertionError("perf_counter called")
+
+    monkeypatch.setattr(encoder.time, 'perf_counter', fail)
+    code = "if x == 1 or x == 2:\n    pass\n"
+    assert "x in (1, 2)" in Encoder(code, [MergeComparisonTransformation()], [1, 0], 2, 4, 0)
+
+
+def test_encoder_reports_profile_info():
+    info = {}
+    code = "if x == 1 or x == 2:\n    pass\n"
+    transformed = Encoder(code, [MergeComparisonTransformation()], [1, 0], 2, 4, 0,
+                          profile=True, profile_info=info)
+    assert "x in (1, 2)" in transformed
+    assert info['captured'] is True
+    assert profiling.get_profile(info['id']) is not None
+
+
+def test_profiling_requires_admin_token(client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    body = {'code': "x = 1\n", 'transformationOrder': []}
+
+    response = client.post('/transform', json=body, headers={'X-ACW-Profile': '1'})
+    assert 'profile_id' not in response.get_json()
+
+    response = client.post('/transform', json=body,
+                           headers={'X-ACW-Profile': '1', 'X-ACW-Admin-Token': 'secret'})
+    profile_id = response.get_json()['profile_id']
+    assert profile_id is not None
+
+    assert client.get('/admin/profiles').status_code == 403
+    response = client.get('/admin/profiles', headers={'X-ACW-Admin-Token': 'secret'})
+    assert [record['id'] for record in response.get_json()['profiles']] == [profile_id]
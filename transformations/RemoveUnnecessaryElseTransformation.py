@@ -1,6 +1,7 @@
 import ast
 import libcst as cst
 from .tranformation import Transformation
+from .chunks import top_level_chunks
 
 class IfEndsWithReturnChecker(ast.NodeVisitor):
     """
@@ -74,14 +75,16 @@ class RemoveUnnecessaryElseTransformation(Transformation):
         to maintain formatting and whitespaces.
         """
         try:
-            # Parse the code into a CST (Concrete Syntax Tree)
-            module = cst.parse_module(code)
             # Initialize the CST transformer
             transformer = RemoveUnnecessaryElseCSTTransformer()
-            # Apply the transformation
-            transformed_module = module.visit(transformer)
+            transformed_chunks = []
+            # Parse and transform one group of top-level statements at a time,
+            # so only that group's CST (Concrete Syntax Tree) is in memory
+            for chunk in top_level_chunks(code):
+                module = cst.parse_module(chunk)
+                transformed_chunks.append(module.visit(transformer).code)
             # Return the transformed code as a string
-            return transformed_module.code
+            return "".join(transformed_chunks)
         except Exception as e:
             print(f"Error during transformation: {e}")
             return code  # Return the original code if an error occurs
\ No newline at end of file
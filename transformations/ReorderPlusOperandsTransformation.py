@@ -2,6 +2,7 @@ import ast
 import libcst as cst
 import hashlib
 from .tranformation import Transformation
+from .chunks import top_level_chunks
 
 class PlusOperationChecker(ast.NodeVisitor):
     def __init__(self):
@@ -48,10 +49,12 @@ class ReorderPlusOperandsTransformation(Transformation):
 
     def transform(self, code: str) -> str:
         try:
-            source_tree = cst.parse_module(code)
             transformer = ReorderPlusOperandsTransformer()
-            transformed_tree = source_tree.visit(transformer)
-            return transformed_tree.code
+            # One top-level statement group at a time to bound the CST's size
+            return "".join(
+                cst.parse_module(chunk).visit(transformer).code
+                for chunk in top_level_chunks(code)
+            )
         except Exception as e:
             print(f"Error during transformation: {e}")
             return code
\ No newline at end of file
@@ -0,0 +1,51 @@
+import ast
+import re
+
+# Approximate amount of source handed to libcst at once
+CHUNK_SIZE = 64 * 1024
+
+_LINE_END = re.compile(r'\r\n|\r|\n')
+
+
+def _statement_starts(code):
+    """
+    Returns the sorted 1-based line numbers at which the source can be cut
+    between two top-level statements.
+    """
+    tree = ast.parse(code)
+    starts = []
+    previous_end = 0
+    for stmt in tree.body:
+        decorators = getattr(stmt, 'decorator_list', [])
+        start = min([stmt.lineno] + [d.lineno for d in decorators])
+        # Skip statements sharing a line with the previous one (`a = 1; b = 2`)
+        if start > previous_end:
+            starts.append(start)
+        previous_end = stmt.end_lineno
+    return starts
+
+
+def top_level_chunks(code, chunk_size=CHUNK_SIZE):
+    """
+    Yields consecutive pieces of `code`, each made of whole top-level
+    statements and roughly `chunk_size` characters long, whose concatenation
+    is `code`. Transformations that only rewrite nodes inside one statement
+    can parse and transform the pieces one at a time, so only one piece's
+    concrete syntax tree is alive at once. Code that does not parse is
+    yielded whole.
+    """
+    try:
+        starts = _statement_starts(code)
+    except SyntaxError:
+        yield code
+        return
+
+    # Character offset of the start of every line
+    line_offsets = [0] + [match.end() for match in _LINE_END.finditer(code)]
+    chunk_start = 0
+    for line in starts:
+        offset = line_offsets[line - 1]
+        if offset - chunk_start >= chunk_size:
+            yield code[chunk_start:offset]
+            chunk_start = offset
+    yield code[chunk_start:]
@@ -0,0 +1,62 @@
+import os
+import zlib
+
+# Upper bound on the (decompressed) size of a submitted code snippet, in bytes
+MAX_CODE_BYTES = int(os.getenv('ACW_MAX_CODE_BYTES', 10 * 1024 * 1024))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class CodeTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+def _gunzip():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def read_limited(stream, gzipped=False, limit=None):
+    """
+    Reads a byte stream in chunks, optionally gunzipping it (multi-member gzip
+    is supported), and stops as soon as the decoded size exceeds `limit`
+    (MAX_CODE_BYTES by default). The body is collected into a single buffer,
+    so the peak is roughly the decoded bytes plus the resulting string.
+
+    Raises CodeTooLarge when the limit is exceeded and InvalidUpload for a
+    truncated or corrupt gzip stream or invalid UTF-8.
+    """
+    if limit is None:
+        limit = MAX_CODE_BYTES
+    decompressor = _gunzip() if gzipped else None
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if decompressor is None:
+            buffer += chunk
+            if len(buffer) > limit:
+                raise CodeTooLarge()
+            continue
+        while chunk:
+            if decompressor.eof:
+                # The previous gzip member ended; the rest is another member
+                decompressor = _gunzip()
+            try:
+                # Never inflate more than one byte past the limit
+                buffer += decompressor.decompress(chunk, limit - len(buffer) + 1)
+            except zlib.error as e:
+                raise InvalidUpload(f'Corrupt gzip body: {e}')
+            if len(buffer) > limit:
+                raise CodeTooLarge()
+            chunk = decompressor.unused_data if decompressor.eof else b''
+    if decompressor is not None and not decompressor.eof:
+        raise InvalidUpload('Truncated gzip body')
+    try:
+        return buffer.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise InvalidUpload(f'Body is not valid UTF-8: {e}')